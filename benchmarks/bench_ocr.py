@@ -0,0 +1,70 @@
+"""Receipt OCR throughput: images processed per second per worker core.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_ocr --images 40 --workers 1 2 4
+
+Needs Pillow, pytesseract and the tesseract binary with the rus language pack.
+"""
+import argparse
+import io
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageDraw
+
+import receipt_ocr
+
+
+def make_receipt(seed):
+    """Render a synthetic receipt photo and return (png bytes, expected total)."""
+    rng = random.Random(seed)
+    items = [(f"Товар {i + 1}", rng.randint(100, 99999) / 100) for i in range(rng.randint(3, 12))]
+    total = round(sum(price for _, price in items), 2)
+
+    lines = ["ООО Ромашка", "Кассовый чек 19.10.2026 12:30", ""]
+    lines += [f"{name:<20}{price:>10.2f}" for name, price in items]
+    lines += ["", f"{'ИТОГО':<20}{total:>10.2f}"]
+
+    image = Image.new('L', (640, 40 + 28 * len(lines)), color=255)
+    draw = ImageDraw.Draw(image)
+    for row, text in enumerate(lines):
+        draw.text((20, 20 + 28 * row), text, fill=0)
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue(), total
+
+
+def run(workers, images):
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Warm the pool so library imports are not part of the measurement
+        list(pool.map(receipt_ocr._warm_up, [None] * workers))
+
+        start = time.perf_counter()
+        results = list(pool.map(receipt_ocr.extract_total, [data for data, _ in images]))
+        elapsed = time.perf_counter() - start
+
+    correct = sum(1 for found, (_, total) in zip(results, images)
+                  if found is not None and abs(found - total) < 0.01)
+    return elapsed, correct
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', type=int, default=40)
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=sorted({1, receipt_ocr.OCR_WORKERS, os.cpu_count() or 1}))
+    args = parser.parse_args()
+
+    images = [make_receipt(seed) for seed in range(args.images)]
+    print(f"{'workers':>8} {'images/s':>10} {'per core':>10} {'accuracy':>9}")
+    for workers in args.workers:
+        elapsed, correct = run(workers, images)
+        rate = len(images) / elapsed
+        print(f"{workers:>8} {rate:>10.2f} {rate / workers:>10.2f} {correct / len(images):>8.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Receipt inserts per second: per-statement commits versus the group-commit writer.
+
+Both sides use one persistent connection with the writer's pragmas (WAL,
+synchronous=FULL), so the difference is the number of commits per insert.
+"Handlers" are concurrent callers; the bot gets that concurrency from
+updates of different chats being processed in parallel.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_writes --writes 2000 --concurrency 1 16 128
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+
+from db_writer import WriteBatcher
+
+SCHEMA = '''CREATE TABLE receipts
+            (id INTEGER PRIMARY KEY AUTOINCREMENT,
+             client_id INTEGER,
+             photo_id TEXT,
+             amount REAL,
+             debt_days INTEGER,
+             date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP)'''
+INSERT = '''INSERT INTO receipts (client_id, photo_id, amount, debt_days, date_added)
+            VALUES (?, ?, ?, ?, ?)'''
+
+
+def fresh_db(directory, name):
+    path = os.path.join(directory, name)
+    conn = sqlite3.connect(path)
+    conn.execute(SCHEMA)
+    conn.commit()
+    conn.close()
+    return path
+
+
+def row(i):
+    return (i % 100, f"photo-{i}", 100.0 + i, 30, datetime.now())
+
+
+async def per_statement(path, writes, concurrency):
+    """One commit per insert, the way the handlers used to write."""
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=FULL")
+    conn.execute("PRAGMA busy_timeout=5000")
+
+    async def handler(indexes):
+        for i in indexes:
+            conn.execute(INSERT, row(i))
+            await asyncio.sleep(0)
+
+    await asyncio.gather(*(handler(range(c, writes, concurrency)) for c in range(concurrency)))
+    conn.close()
+
+
+async def batched(path, writes, concurrency):
+    writer = WriteBatcher(path)
+    await writer.start()
+
+    async def handler(indexes):
+        for i in indexes:
+            await writer.execute(INSERT, row(i))
+
+    await asyncio.gather(*(handler(range(c, writes, concurrency)) for c in range(concurrency)))
+    await writer.stop()
+
+
+def measure(directory, name, runner, writes, concurrency):
+    path = fresh_db(directory, name)
+    start = time.perf_counter()
+    asyncio.run(runner(path, writes, concurrency))
+    elapsed = time.perf_counter() - start
+
+    conn = sqlite3.connect(path)
+    count = conn.execute("SELECT COUNT(*) FROM receipts").fetchone()[0]
+    conn.close()
+    assert count == writes, f"{name}: expected {writes} rows, found {count}"
+    return writes / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writes', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16, 128],
+                        help='handlers writing at the same time')
+    args = parser.parse_args()
+
+    print(f"{'handlers':>8} {'per-statement/s':>16} {'batched/s':>10} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        for concurrency in args.concurrency:
+            baseline = measure(directory, f"single-{concurrency}.db", per_statement, args.writes, concurrency)
+            grouped = measure(directory, f"batched-{concurrency}.db", batched, args.writes, concurrency)
+            print(f"{concurrency:>8} {baseline:>16.0f} {grouped:>10.0f} {grouped / baseline:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,17 @@
 import os
+import sys
+import asyncio
+import time
 import logging
 from datetime import datetime, timedelta
 from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardRemove
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters, ConversationHandler
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters, ConversationHandler, TypeHandler, BaseUpdateProcessor
 import sqlite3
 
-# Enable logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+import receipt_ocr
+from db_writer import WriteBatcher
+from overdue_snapshot import OverdueSnapshot
+from logging_setup import setup_logging, log_handler
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +22,21 @@ logger = logging.getLogger(__name__)
  SELECTING_CLIENT_FOR_DELETE, SELECTING_RECEIPT_FOR_DELETE,
  SELECTING_CLIENT_FOR_PAYMENT, ADDING_PAYMENT_AMOUNT) = range(11)
 
+# Idle conversations are ended after this many seconds
+CONVERSATION_TIMEOUT = int(os.getenv('CONVERSATION_TIMEOUT', 600))
+# How often abandoned user_data is swept
+CLEANUP_INTERVAL = int(os.getenv('CLEANUP_INTERVAL', 300))
+# Updates from different chats processed at the same time
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', 64))
+
+# Each conversation keeps its data in its own dict, user_data[<flow>]. The
+# conversations run independently, so one can be open while another starts.
+ADD_CLIENT_FLOW = 'add_client'
+ADD_RECEIPT_FLOW = 'add_receipt'
+VIEW_RECEIPTS_FLOW = 'view_receipts'
+DELETE_RECEIPT_FLOW = 'delete_receipt'
+FLOWS = (ADD_CLIENT_FLOW, ADD_RECEIPT_FLOW, VIEW_RECEIPTS_FLOW, DELETE_RECEIPT_FLOW)
+
 # Keyboard for main menu
 def get_main_keyboard():
     keyboard = [
@@ -29,12 +46,24 @@ def get_main_keyboard():
     ]
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
+DB_PATH = 'debt_bot.db'
+
+# All inserts, updates and deletes go through this single group-committing writer
+db_writer = WriteBatcher(
+    DB_PATH,
+    window=float(os.getenv('DB_WRITE_WINDOW', 0)),
+    max_batch=int(os.getenv('DB_WRITE_MAX_BATCH', 256))
+)
+
+# Overdue report kept up to date as receipts and payments change
+overdue = OverdueSnapshot()
+
 # Database connection
 def get_connection():
     try:
-        return sqlite3.connect('debt_bot.db')
-    except Exception as e:
-        logger.error(f"Database connection error: {e}")
+        return sqlite3.connect(DB_PATH)
+    except Exception:
+        logger.exception("Database connection error")
         raise
 
 def init_db():
@@ -67,14 +96,35 @@ def init_db():
                      FOREIGN KEY (client_id) REFERENCES clients (id))''')
         
         conn.commit()
-    except Exception as e:
-        logger.error(f"Database initialization error: {e}")
+    except Exception:
+        logger.exception("Database initialization error")
         raise
     finally:
         cur.close()
         conn.close()
 
+# Database writes, run by db_writer inside a batch transaction
+def insert_client(cur, name, phone):
+    """Add a client unless the phone is taken; return (client_id, existing_name)."""
+    cur.execute("SELECT name FROM clients WHERE phone = ?", (phone,))
+    existing_client = cur.fetchone()
+    if existing_client:
+        return None, existing_client[0]
+    cur.execute("INSERT INTO clients (name, phone) VALUES (?, ?)", (name, phone))
+    return cur.lastrowid, None
+
+def insert_receipt(cur, client_id, photo_id, amount, days, date_added):
+    """Add a receipt; return (receipt_id, client_name)."""
+    cur.execute("""
+        INSERT INTO receipts (client_id, photo_id, amount, debt_days, date_added)
+        VALUES (?, ?, ?, ?, ?)
+    """, (client_id, photo_id, amount, days, date_added))
+    receipt_id = cur.lastrowid
+    cur.execute("SELECT name FROM clients WHERE id = ?", (client_id,))
+    return receipt_id, cur.fetchone()[0]
+
 # Command handlers
+@log_handler
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send a message when the command /start is issued."""
     try:
@@ -88,26 +138,29 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             welcome_message,
             reply_markup=get_main_keyboard()
         )
-    except Exception as e:
-        logger.error(f"Error in start command: {e}")
+    except Exception:
+        logger.exception("Error in start command")
         await update.message.reply_text("Произошла ошибка при запуске бота. Попробуйте позже.")
 # Client management
+@log_handler
 async def add_client_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start the process of adding a new client."""
     try:
+        start_flow(context, ADD_CLIENT_FLOW)
         await update.message.reply_text(
             "Введите имя клиента:",
             reply_markup=ReplyKeyboardRemove()
         )
         return ADDING_CLIENT_NAME
-    except Exception as e:
-        logger.error(f"Error in add_client_start: {e}")
+    except Exception:
+        logger.exception("Error in add_client_start")
         await update.message.reply_text(
             "Произошла ошибка. Попробуйте позже.",
             reply_markup=get_main_keyboard()
         )
-        return ConversationHandler.END
+        return end_conversation(context, ADD_CLIENT_FLOW)
 
+@log_handler
 async def add_client_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Process client name and ask for phone number."""
     try:
@@ -118,24 +171,25 @@ async def add_client_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return ADDING_CLIENT_NAME
             
-        context.user_data['client_name'] = name
+        context.user_data[ADD_CLIENT_FLOW]['client_name'] = name
         await update.message.reply_text(
             "Введите номер телефона клиента:"
         )
         return ADDING_CLIENT_PHONE
-    except Exception as e:
-        logger.error(f"Error in add_client_name: {e}")
+    except Exception:
+        logger.exception("Error in add_client_name")
         await update.message.reply_text(
             "Произошла ошибка. Попробуйте позже.",
             reply_markup=get_main_keyboard()
         )
-        return ConversationHandler.END
+        return end_conversation(context, ADD_CLIENT_FLOW)
 
+@log_handler
 async def add_client_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Process client phone number and save client to database."""
     try:
         phone = update.message.text
-        name = context.user_data['client_name']
+        name = context.user_data[ADD_CLIENT_FLOW]['client_name']
         
         # Simple phone validation
         phone = phone.replace(' ', '').replace('-', '').replace('(', '').replace(')', '')
@@ -145,43 +199,36 @@ async def add_client_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return ADDING_CLIENT_PHONE
         
-        conn = get_connection()
-        cur = conn.cursor()
-        
-        # Check if phone already exists
-        cur.execute("SELECT name FROM clients WHERE phone = ?", (phone,))
-        existing_client = cur.fetchone()
-        if existing_client:
+        # Add new client unless the phone already exists
+        client_id, existing_name = await db_writer.submit(insert_client, name, phone)
+        if existing_name:
             await update.message.reply_text(
-                f"Этот номер телефона уже зарегистрирован на клиента {existing_client[0]}.",
+                f"Этот номер телефона уже зарегистрирован на клиента {existing_name}.",
                 reply_markup=get_main_keyboard()
             )
-            return ConversationHandler.END
-        
-        # Add new client
-        cur.execute("INSERT INTO clients (name, phone) VALUES (?, ?)", (name, phone))
-        conn.commit()
-        cur.close()
-        conn.close()
+            return end_conversation(context, ADD_CLIENT_FLOW)
+        overdue.client_added(client_id, name, phone)
         
         await update.message.reply_text(
             f"✅ Клиент {name} успешно добавлен!",
             reply_markup=get_main_keyboard()
         )
-        return ConversationHandler.END
+        return end_conversation(context, ADD_CLIENT_FLOW)
         
-    except Exception as e:
-        logger.error(f"Error in add_client_phone: {e}")
+    except Exception:
+        logger.exception("Error in add_client_phone")
         await update.message.reply_text(
             "Произошла ошибка при добавлении клиента. Попробуйте позже.",
             reply_markup=get_main_keyboard()
         )
-        return ConversationHandler.END
+        return end_conversation(context, ADD_CLIENT_FLOW)
 
 # Receipt management
+@log_handler
 async def add_receipt_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start the process of adding a new receipt."""
     try:
+        start_flow(context, ADD_RECEIPT_FLOW)
         conn = get_connection()
         cur = conn.cursor()
         cur.execute("SELECT id, name, phone FROM clients ORDER BY name")
@@ -194,7 +241,7 @@ async def add_receipt_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "❌ Сначала добавьте хотя бы одного клиента!",
                 reply_markup=get_main_keyboard()
             )
-            return ConversationHandler.END
+            return end_conversation(context, ADD_RECEIPT_FLOW)
         
         keyboard = [[InlineKeyboardButton(f"{name} ({phone})", callback_data=f'client_{id}')] 
                    for id, name, phone in clients]
@@ -206,13 +253,14 @@ async def add_receipt_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return SELECTING_CLIENT_FOR_RECEIPT
         
-    except Exception as e:
-        logger.error(f"Error in add_receipt_start: {e}")
+    except Exception:
+        logger.exception("Error in add_receipt_start")
         await update.message.reply_text(
             "Произошла ошибка. Попробуйте позже.",
             reply_markup=get_main_keyboard()
         )
-        return ConversationHandler.END
+        return end_conversation(context, ADD_RECEIPT_FLOW)
+@log_handler
 async def select_client_for_receipt(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle client selection for receipt."""
     try:
@@ -220,36 +268,70 @@ async def select_client_for_receipt(update: Update, context: ContextTypes.DEFAUL
         await query.answer()
         
         client_id = int(query.data.split('_')[1])
-        context.user_data['selected_client_id'] = client_id
+        context.user_data[ADD_RECEIPT_FLOW]['selected_client_id'] = client_id
         
         await query.edit_message_text("📸 Отправьте фото чека:")
         return UPLOADING_RECEIPT
-    except Exception as e:
-        logger.error(f"Error in select_client_for_receipt: {e}")
+    except Exception:
+        logger.exception("Error in select_client_for_receipt")
         await query.edit_message_text(
             "Произошла ошибка. Попробуйте позже.",
             reply_markup=get_main_keyboard()
         )
-        return ConversationHandler.END
+        return end_conversation(context, ADD_RECEIPT_FLOW)
 
+@log_handler
 async def handle_receipt_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Process receipt photo and ask for amount."""
+    """Process receipt photo and ask for amount; the recognized total is suggested later."""
     try:
         photo = update.message.photo[-1]
-        context.user_data['receipt_photo_id'] = photo.file_id
+        flow = context.user_data[ADD_RECEIPT_FLOW]
+        flow['receipt_photo_id'] = photo.file_id
+        flow.pop('receipt_ocr_amount', None)
+        flow.pop('receipt_amount', None)
         
-        await update.message.reply_text(
+        prompt = await update.message.reply_text(
             "💰 Введите сумму чека (например: 1000.50):"
         )
+        # OCR can take seconds; don't hold up this chat's or anyone else's updates
+        context.application.create_task(
+            suggest_receipt_amount(context, photo, prompt),
+            update=update
+        )
         return ADDING_RECEIPT_AMOUNT
-    except Exception as e:
-        logger.error(f"Error in handle_receipt_photo: {e}")
+    except Exception:
+        logger.exception("Error in handle_receipt_photo")
         await update.message.reply_text(
             "Произошла ошибка при обработке фото. Попробуйте позже.",
             reply_markup=get_main_keyboard()
         )
-        return ConversationHandler.END
+        return end_conversation(context, ADD_RECEIPT_FLOW)
+
+async def suggest_receipt_amount(context: ContextTypes.DEFAULT_TYPE, photo, prompt):
+    """Recognize the receipt total and add a one-tap button to the amount prompt."""
+    try:
+        photo_file = await photo.get_file()
+        image = await photo_file.download_as_bytearray()
+        amount = await receipt_ocr.recognize_total(image)
+    except Exception:
+        logger.warning("Receipt photo download failed", exc_info=True)
+        return
+    
+    # Skip the suggestion if the amount was typed meanwhile, another photo was
+    # sent or the conversation is over
+    flow = context.user_data.get(ADD_RECEIPT_FLOW)
+    if not amount or flow is None or flow.get('receipt_photo_id') != photo.file_id or 'receipt_amount' in flow:
+        return
+    
+    flow['receipt_ocr_amount'] = amount
+    keyboard = [[InlineKeyboardButton(f"✅ {amount:.2f} руб.", callback_data='ocr_amount')]]
+    await prompt.edit_text(
+        f"🔍 Распознанная сумма: {amount:.2f} руб.\n"
+        "Нажмите кнопку, чтобы подтвердить, или введите сумму вручную (например: 1000.50):",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
 
+@log_handler
 async def add_receipt_amount(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Process receipt amount and ask for debt days."""
     try:
@@ -261,7 +343,9 @@ async def add_receipt_amount(update: Update, context: ContextTypes.DEFAULT_TYPE)
             )
             return ADDING_RECEIPT_AMOUNT
             
-        context.user_data['receipt_amount'] = amount
+        flow = context.user_data[ADD_RECEIPT_FLOW]
+        flow['receipt_amount'] = amount
+        flow.pop('receipt_ocr_amount', None)
         await update.message.reply_text(
             "📅 Введите количество дней для оплаты долга:"
         )
@@ -271,14 +355,44 @@ async def add_receipt_amount(update: Update, context: ContextTypes.DEFAULT_TYPE)
             "❌ Некорректная сумма. Введите число (например: 1000.50):"
         )
         return ADDING_RECEIPT_AMOUNT
-    except Exception as e:
-        logger.error(f"Error in add_receipt_amount: {e}")
+    except Exception:
+        logger.exception("Error in add_receipt_amount")
         await update.message.reply_text(
             "Произошла ошибка. Попробуйте позже.",
             reply_markup=get_main_keyboard()
         )
-        return ConversationHandler.END
+        return end_conversation(context, ADD_RECEIPT_FLOW)
 
+@log_handler
+async def accept_ocr_amount(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Use the recognized receipt amount and ask for debt days."""
+    try:
+        query = update.callback_query
+        await query.answer()
+        
+        flow = context.user_data[ADD_RECEIPT_FLOW]
+        amount = flow.pop('receipt_ocr_amount', None)
+        if amount is None:
+            await query.edit_message_text(
+                "💰 Введите сумму чека (например: 1000.50):"
+            )
+            return ADDING_RECEIPT_AMOUNT
+        
+        flow['receipt_amount'] = amount
+        await query.edit_message_text(
+            f"💰 Сумма: {amount:.2f} руб.\n\n"
+            "📅 Введите количество дней для оплаты долга:"
+        )
+        return ADDING_DEBT_DAYS
+    except Exception:
+        logger.exception("Error in accept_ocr_amount")
+        await query.edit_message_text(
+            "Произошла ошибка. Попробуйте позже.",
+            reply_markup=get_main_keyboard()
+        )
+        return end_conversation(context, ADD_RECEIPT_FLOW)
+
+@log_handler
 async def add_receipt_days(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Process debt days and save receipt to database."""
     try:
@@ -289,26 +403,18 @@ async def add_receipt_days(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return ADDING_DEBT_DAYS
             
-        client_id = context.user_data['selected_client_id']
-        photo_id = context.user_data['receipt_photo_id']
-        amount = context.user_data['receipt_amount']
-        
-        conn = get_connection()
-        cur = conn.cursor()
+        flow = context.user_data[ADD_RECEIPT_FLOW]
+        client_id = flow['selected_client_id']
+        photo_id = flow['receipt_photo_id']
+        amount = flow['receipt_amount']
         
-        # Add receipt
-        cur.execute("""
-            INSERT INTO receipts (client_id, photo_id, amount, debt_days, date_added)
-            VALUES (?, ?, ?, ?, ?)
-        """, (client_id, photo_id, amount, days, datetime.now()))
-        
-        # Get client name
-        cur.execute("SELECT name FROM clients WHERE id = ?", (client_id,))
-        client_name = cur.fetchone()[0]
-        
-        conn.commit()
-        cur.close()
-        conn.close()
+        date_added = datetime.now()
+        receipt_id, client_name = await db_writer.submit(
+            insert_receipt, client_id, photo_id, amount, days, date_added
+        )
+        # A new receipt is only overdue once its due date passes; refresh then
+        changed = overdue.receipt_added(receipt_id, client_id, amount, date_added, days)
+        schedule_overdue_refresh(context.job_queue, when=0 if changed else None)
         
         # Calculate due date
         due_date = datetime.now() + timedelta(days=days)
@@ -324,24 +430,26 @@ async def add_receipt_days(update: Update, context: ContextTypes.DEFAULT_TYPE):
             success_message,
             reply_markup=get_main_keyboard()
         )
-        return ConversationHandler.END
+        return end_conversation(context, ADD_RECEIPT_FLOW)
         
     except ValueError:
         await update.message.reply_text(
             "❌ Некорректное количество дней. Введите целое число:"
         )
         return ADDING_DEBT_DAYS
-    except Exception as e:
-        logger.error(f"Error in add_receipt_days: {e}")
+    except Exception:
+        logger.exception("Error in add_receipt_days")
         await update.message.reply_text(
             "Произошла ошибка при сохранении чека. Попробуйте позже.",
             reply_markup=get_main_keyboard()
         )
-        return ConversationHandler.END
+        return end_conversation(context, ADD_RECEIPT_FLOW)
         # View receipts
+@log_handler
 async def view_receipts_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start the process of viewing receipts."""
     try:
+        start_flow(context, VIEW_RECEIPTS_FLOW)
         conn = get_connection()
         cur = conn.cursor()
         
@@ -369,7 +477,7 @@ async def view_receipts_start(update: Update, context: ContextTypes.DEFAULT_TYPE
                 "📭 Нет чеков для просмотра.",
                 reply_markup=get_main_keyboard()
             )
-            return ConversationHandler.END
+            return end_conversation(context, VIEW_RECEIPTS_FLOW)
         
         keyboard = []
         for id, name, phone, receipt_count, total_debt in clients:
@@ -386,14 +494,15 @@ async def view_receipts_start(update: Update, context: ContextTypes.DEFAULT_TYPE
         )
         return SELECTING_CLIENT_FOR_VIEW
         
-    except Exception as e:
-        logger.error(f"Error in view_receipts_start: {e}")
+    except Exception:
+        logger.exception("Error in view_receipts_start")
         await update.message.reply_text(
             "Произошла ошибка. Попробуйте позже.",
             reply_markup=get_main_keyboard()
         )
-        return ConversationHandler.END
+        return end_conversation(context, VIEW_RECEIPTS_FLOW)
 
+@log_handler
 async def show_client_receipts(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show all receipts for selected client."""
     try:
@@ -471,116 +580,50 @@ async def show_client_receipts(update: Update, context: ContextTypes.DEFAULT_TYP
             reply_markup=get_main_keyboard()
         )
         
-        return ConversationHandler.END
+        return end_conversation(context, VIEW_RECEIPTS_FLOW)
         
-    except Exception as e:
-        logger.error(f"Error in show_client_receipts: {e}")
+    except Exception:
+        logger.exception("Error in show_client_receipts")
         await query.edit_message_text(
             "Произошла ошибка при загрузке чеков. Попробуйте позже.",
             reply_markup=get_main_keyboard()
         )
-        return ConversationHandler.END
+        return end_conversation(context, VIEW_RECEIPTS_FLOW)
         # Overdue debts
+@log_handler
 async def show_overdue_debts(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show all overdue debts."""
     try:
-        current_time = datetime.now()
-        
-        conn = get_connection()
-        cur = conn.cursor()
-        
-        # Get overdue debts with detailed information
-        cur.execute("""
-            SELECT 
-                c.name, c.phone,
-                r.amount, r.date_added, r.debt_days,
-                COALESCE((
-                    SELECT SUM(amount) 
-                    FROM payments p 
-                    WHERE p.client_id = c.id
-                ), 0) as paid_amount
-            FROM receipts r
-            JOIN clients c ON r.client_id = c.id
-            WHERE datetime(r.date_added, '+' || r.debt_days || ' days') < ?
-            ORDER BY c.name, r.date_added
-        """, (current_time,))
-        
-        overdue = cur.fetchall()
-        cur.close()
-        conn.close()
+        chunks = overdue.render()
         
-        if not overdue:
+        if not chunks:
             await update.message.reply_text(
                 "✅ Нет просроченных долгов.",
                 reply_markup=get_main_keyboard()
             )
             return
         
-        # Group by client
-        client_debts = {}
-        for name, phone, amount, date_added, days, paid_amount in overdue:
-            if name not in client_debts:
-                client_debts[name] = {
-                    'phone': phone,
-                    'total_debt': 0,
-                    'paid': paid_amount,
-                    'debts': []
-                }
-            
-            due_date = datetime.strptime(date_added, '%Y-%m-%d %H:%M:%S.%f') + timedelta(days=days)
-            days_overdue = (current_time - due_date).days
-            
-            client_debts[name]['total_debt'] += amount
-            client_debts[name]['debts'].append({
-                'amount': amount,
-                'due_date': due_date,
-                'days_overdue': days_overdue
-            })
-        
-        # Format message
-        message = "⚠️ Просроченные долги:\n\n"
-        for client_name, data in client_debts.items():
-            remaining_debt = data['total_debt'] - data['paid']
-            if remaining_debt <= 0:
-                continue
-                
-            message += f"👤 Клиент: {client_name}\n"
-            message += f"📱 Телефон: {data['phone']}\n"
-            message += f"💰 Общий долг: {data['total_debt']:.2f} руб.\n"
-            message += f"💵 Оплачено: {data['paid']:.2f} руб.\n"
-            message += f"📊 Остаток: {remaining_debt:.2f} руб.\n\n"
-            message += "Просроченные чеки:\n"
-            
-            for debt in data['debts']:
-                message += (
-                    f"- {debt['amount']:.2f} руб. "
-                    f"(просрочка {debt['days_overdue']} дней)\n"
-                )
-            message += "\n"
-        
-        # Split message if it's too long
-        if len(message) > 4096:
-            for x in range(0, len(message), 4096):
-                await update.message.reply_text(message[x:x+4096])
-        else:
-            await update.message.reply_text(message)
+        for chunk in chunks:
+            await update.message.reply_text(chunk)
             
         await update.message.reply_text(
             "Вернуться в главное меню:",
             reply_markup=get_main_keyboard()
         )
         
-    except Exception as e:
-        logger.error(f"Error in show_overdue_debts: {e}")
+    except Exception:
+        logger.exception("Error in show_overdue_debts")
         await update.message.reply_text(
             "Произошла ошибка при получении данных о долгах. Попробуйте позже.",
             reply_markup=get_main_keyboard()
         )
 
 # Delete receipt
+@log_handler
 async def delete_receipt_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start the process of deleting a receipt."""
     try:
+        start_flow(context, DELETE_RECEIPT_FLOW)
         conn = get_connection()
         cur = conn.cursor()
         
@@ -603,7 +646,7 @@ async def delete_receipt_start(update: Update, context: ContextTypes.DEFAULT_TYP
                 "📭 Нет чеков для удаления.",
                 reply_markup=get_main_keyboard()
             )
-            return ConversationHandler.END
+            return end_conversation(context, DELETE_RECEIPT_FLOW)
         
         keyboard = []
         for id, name, phone, receipt_count in clients:
@@ -618,21 +661,23 @@ async def delete_receipt_start(update: Update, context: ContextTypes.DEFAULT_TYP
         )
         return SELECTING_CLIENT_FOR_DELETE
         
-    except Exception as e:
-        logger.error(f"Error in delete_receipt_start: {e}")
+    except Exception:
+        logger.exception("Error in delete_receipt_start")
         await update.message.reply_text(
             "Произошла ошибка. Попробуйте позже.",
             reply_markup=get_main_keyboard()
         )
-        return ConversationHandler.END
-        async def show_receipts_for_delete(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        return end_conversation(context, DELETE_RECEIPT_FLOW)
+
+@log_handler
+async def show_receipts_for_delete(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show receipts available for deletion."""
     try:
         query = update.callback_query
         await query.answer()
         
         client_id = int(query.data.split('_')[2])
-        context.user_data['selected_client_id'] = client_id
+        context.user_data[DELETE_RECEIPT_FLOW]['selected_client_id'] = client_id
         
         conn = get_connection()
         cur = conn.cursor()
@@ -669,14 +714,15 @@ async def delete_receipt_start(update: Update, context: ContextTypes.DEFAULT_TYP
         
         return SELECTING_RECEIPT_FOR_DELETE
         
-    except Exception as e:
-        logger.error(f"Error in show_receipts_for_delete: {e}")
+    except Exception:
+        logger.exception("Error in show_receipts_for_delete")
         await query.edit_message_text(
             "Произошла ошибка. Попробуйте позже.",
             reply_markup=get_main_keyboard()
         )
-        return ConversationHandler.END
+        return end_conversation(context, DELETE_RECEIPT_FLOW)
 
+@log_handler
 async def delete_receipt(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Delete selected receipt."""
     try:
@@ -685,37 +731,178 @@ async def delete_receipt(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         receipt_id = int(query.data.split('_')[2])
         
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("DELETE FROM receipts WHERE id = ?", (receipt_id,))
-        conn.commit()
-        cur.close()
-        conn.close()
+        await db_writer.execute("DELETE FROM receipts WHERE id = ?", (receipt_id,))
+        if overdue.receipt_removed(receipt_id):
+            schedule_overdue_refresh(context.job_queue, when=0)
         
         await query.edit_message_text(
             "✅ Чек успешно удален!",
             reply_markup=get_main_keyboard()
         )
-        return ConversationHandler.END
+        return end_conversation(context, DELETE_RECEIPT_FLOW)
         
-    except Exception as e:
-        logger.error(f"Error in delete_receipt: {e}")
+    except Exception:
+        logger.exception("Error in delete_receipt")
         await query.edit_message_text(
             "Произошла ошибка при удалении чека. Попробуйте позже.",
             reply_markup=get_main_keyboard()
         )
-        return ConversationHandler.END
+        return end_conversation(context, DELETE_RECEIPT_FLOW)
 
-async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Cancel current operation."""
-    await update.message.reply_text(
-        'Операция отменена.',
-        reply_markup=get_main_keyboard()
-    )
+def cancel_handler(flow):
+    """Build the /cancel fallback of one conversation."""
+    @log_handler
+    async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Cancel current operation."""
+        await update.message.reply_text(
+            'Операция отменена.',
+            reply_markup=get_main_keyboard()
+        )
+        return end_conversation(context, flow)
+    return cancel
+
+# Conversation state
+def start_flow(context: ContextTypes.DEFAULT_TYPE, flow):
+    """Give a conversation fresh user_data, dropping what an earlier run left."""
+    context.user_data[flow] = {}
+    return context.user_data[flow]
+
+def end_conversation(context: ContextTypes.DEFAULT_TYPE, flow):
+    """Drop the conversation's user_data and end it; other flows keep theirs."""
+    context.user_data.pop(flow, None)
     return ConversationHandler.END
 
+async def touch_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Remember when the user was last seen, for the cleanup job."""
+    if context.user_data is not None:
+        context.user_data['last_activity'] = time.monotonic()
+
+def timeout_handler(flow):
+    """Build the handler run when one conversation times out."""
+    @log_handler
+    async def conversation_timed_out(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Tell the user their unfinished operation was cancelled."""
+        try:
+            if update.effective_chat:
+                await context.bot.send_message(
+                    chat_id=update.effective_chat.id,
+                    text="⌛ Время ожидания истекло, операция отменена. Начните заново из меню.",
+                    reply_markup=get_main_keyboard()
+                )
+        except Exception:
+            logger.exception("Error in conversation_timed_out")
+        return end_conversation(context, flow)
+    return TypeHandler(Update, conversation_timed_out)
+
+async def evict_stale_user_data(context: ContextTypes.DEFAULT_TYPE):
+    """Drop conversation data of users idle longer than CONVERSATION_TIMEOUT."""
+    application = context.application
+    now = time.monotonic()
+    evicted = live = size = 0
+    
+    for user_id, user_data in list(application.user_data.items()):
+        last_activity = user_data.get('last_activity', 0)
+        if now - last_activity > CONVERSATION_TIMEOUT:
+            for flow in FLOWS:
+                if user_data.pop(flow, None) is not None:
+                    evicted += 1
+            if set(user_data) <= {'last_activity'}:
+                application.drop_user_data(user_id)
+                continue
+        live += sum(flow in user_data for flow in FLOWS)
+        size += sys.getsizeof(user_data) + sum(sys.getsizeof(v) for v in user_data.values())
+    
+    logger.info(
+        "Conversation cleanup: %d users tracked, %d live conversations, %d evicted, ~%d bytes",
+        len(application.user_data), live, evicted, size
+    )
+
+async def refresh_overdue_snapshot(context: ContextTypes.DEFAULT_TYPE):
+    """Re-render the overdue report and wait for its next change."""
+    overdue.render()
+    schedule_overdue_refresh(context.job_queue)
+
+def schedule_overdue_refresh(job_queue, when=None):
+    """Run refresh_overdue_snapshot after `when` seconds, or at the next due date."""
+    for job in job_queue.get_jobs_by_name('refresh_overdue_snapshot'):
+        job.schedule_removal()
+    if when is None:
+        next_change = overdue.next_change()
+        if next_change is None:
+            return
+        when = max(0, (next_change - datetime.now()).total_seconds())
+    job_queue.run_once(refresh_overdue_snapshot, when, name='refresh_overdue_snapshot')
+
+async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
+    """Log exceptions that escaped a handler."""
+    extra = {}
+    if isinstance(update, Update):
+        extra = {
+            'update_id': update.update_id,
+            'chat_id': update.effective_chat.id if update.effective_chat else None,
+            'user_id': update.effective_user.id if update.effective_user else None,
+        }
+    logger.error("Unhandled error while processing an update", exc_info=context.error, extra=extra)
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Process updates from different chats concurrently, one at a time per chat.
+
+    Conversations keep seeing their updates in order, while a slow handler
+    in one chat no longer holds up the others.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._locks = {}  # chat_id -> [lock, number of updates using it]
+
+    async def process_update(self, update, coroutine):  # type: ignore[misc]
+        # The chat's turn comes first and only then one of the shared slots;
+        # updates queued behind a slow handler must not hold slots other
+        # chats could use.
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            await super().process_update(update, coroutine)
+            return
+        
+        entry = self._locks.setdefault(chat.id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await super().process_update(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[chat.id]
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+async def post_init(application: Application):
+    """Start background workers before polling begins."""
+    await db_writer.start()
+    await receipt_ocr.start_pool()
+    
+    conn = get_connection()
+    try:
+        overdue.load(conn)
+    finally:
+        conn.close()
+    schedule_overdue_refresh(application.job_queue, when=0)
+
+async def post_shutdown(application: Application):
+    """Stop background workers."""
+    receipt_ocr.stop_pool()
+    await db_writer.stop()
+
 def main():
     """Start the bot."""
+    log_listener = setup_logging()
     try:
         # Initialize database
         init_db()
@@ -726,16 +913,31 @@ def main():
             raise ValueError("No token provided")
         
         # Initialize bot
-        application = Application.builder().token(token).build()
+        builder = (
+            Application.builder()
+            .token(token)
+            .post_init(post_init)
+            .post_shutdown(post_shutdown)
+            .concurrent_updates(PerChatUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        )
+        
+        # Alternative Bot API server, e.g. the fake one used by the load test
+        api_url = os.getenv('BOT_API_BASE_URL')
+        if api_url:
+            builder = builder.base_url(f"{api_url}/bot").base_file_url(f"{api_url}/file/bot")
+        
+        application = builder.build()
         
         # Add conversation handlers
         add_client_conv = ConversationHandler(
             entry_points=[MessageHandler(filters.Regex('^👤 Добавить клиента$'), add_client_start)],
             states={
                 ADDING_CLIENT_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_client_name)],
-                ADDING_CLIENT_PHONE: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_client_phone)]
+                ADDING_CLIENT_PHONE: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_client_phone)],
+                ConversationHandler.TIMEOUT: [timeout_handler(ADD_CLIENT_FLOW)]
             },
-            fallbacks=[CommandHandler('cancel', cancel)]
+            fallbacks=[CommandHandler('cancel', cancel_handler(ADD_CLIENT_FLOW))],
+            conversation_timeout=CONVERSATION_TIMEOUT
         )
         
         add_receipt_conv = ConversationHandler(
@@ -745,18 +947,25 @@ def main():
                     CallbackQueryHandler(select_client_for_receipt, pattern='^client_')
                 ],
                 UPLOADING_RECEIPT: [MessageHandler(filters.PHOTO, handle_receipt_photo)],
-                ADDING_RECEIPT_AMOUNT: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_receipt_amount)],
-                ADDING_DEBT_DAYS: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_receipt_days)]
+                ADDING_RECEIPT_AMOUNT: [
+                    MessageHandler(filters.TEXT & ~filters.COMMAND, add_receipt_amount),
+                    CallbackQueryHandler(accept_ocr_amount, pattern='^ocr_amount$')
+                ],
+                ADDING_DEBT_DAYS: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_receipt_days)],
+                ConversationHandler.TIMEOUT: [timeout_handler(ADD_RECEIPT_FLOW)]
             },
-            fallbacks=[CommandHandler('cancel', cancel)]
+            fallbacks=[CommandHandler('cancel', cancel_handler(ADD_RECEIPT_FLOW))],
+            conversation_timeout=CONVERSATION_TIMEOUT
         )
         
         view_receipts_conv = ConversationHandler(
             entry_points=[MessageHandler(filters.Regex('^👁 Просмотр чеков$'), view_receipts_start)],
             states={
-                SELECTING_CLIENT_FOR_VIEW: [CallbackQueryHandler(show_client_receipts, pattern='^view_')]
+                SELECTING_CLIENT_FOR_VIEW: [CallbackQueryHandler(show_client_receipts, pattern='^view_')],
+                ConversationHandler.TIMEOUT: [timeout_handler(VIEW_RECEIPTS_FLOW)]
             },
-            fallbacks=[CommandHandler('cancel', cancel)]
+            fallbacks=[CommandHandler('cancel', cancel_handler(VIEW_RECEIPTS_FLOW))],
+            conversation_timeout=CONVERSATION_TIMEOUT
         )
         
         delete_receipt_conv = ConversationHandler(
@@ -767,9 +976,11 @@ def main():
                 ],
                 SELECTING_RECEIPT_FOR_DELETE: [
                     CallbackQueryHandler(delete_receipt, pattern='^delete_receipt_')
-                ]
+                ],
+                ConversationHandler.TIMEOUT: [timeout_handler(DELETE_RECEIPT_FLOW)]
             },
-            fallbacks=[CommandHandler('cancel', cancel)]
+            fallbacks=[CommandHandler('cancel', cancel_handler(DELETE_RECEIPT_FLOW))],
+            conversation_timeout=CONVERSATION_TIMEOUT
         )
         
         # Add handlers
@@ -782,13 +993,25 @@ def main():
             show_overdue_debts
         ))
         application.add_handler(delete_receipt_conv)
+        application.add_handler(TypeHandler(Update, touch_activity), group=-1)
+        application.add_error_handler(error_handler)
+        
+        # Sweep user_data left behind by abandoned conversations
+        application.job_queue.run_repeating(
+            evict_stale_user_data,
+            interval=CLEANUP_INTERVAL,
+            first=CLEANUP_INTERVAL,
+            name='evict_stale_user_data'
+        )
         
         # Start polling
         application.run_polling(allowed_updates=Update.ALL_TYPES)
         
-    except Exception as e:
-        logger.error(f"Error in main: {e}")
+    except Exception:
+        logger.exception("Error in main")
         raise
+    finally:
+        log_listener.stop()
 
 if __name__ == '__main__':
     main()
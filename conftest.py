@@ -0,0 +1 @@
+# Lets tests import the top-level bot modules when run with plain `pytest`
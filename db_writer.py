@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBatcher:
+    """Single writer that group-commits mutations from many handlers.
+
+    Mutations are functions taking a cursor. Everything queued while the
+    previous batch was committing, plus whatever arrives within `window`
+    seconds, runs in one transaction. Each mutation gets its own savepoint
+    so a failing one does not take the others down.
+    A caller's await returns only after the transaction holding its
+    mutation has been committed.
+    """
+
+    def __init__(self, path, window=0.0, max_batch=256):
+        self.path = path
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = None
+        self._task = None
+        self._thread = None
+        self._conn = None
+
+    async def start(self):
+        if self._task is not None:
+            return
+        # sqlite3 connections belong to the thread that opened them
+        self._thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._thread, self._open)
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Commit whatever is queued and close the connection."""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._thread, self._conn.close)
+        self._thread.shutdown()
+        self._task = self._thread = self._conn = None
+
+    async def submit(self, mutation, *args):
+        """Run `mutation(cursor, *args)` in the next batch and return its result."""
+        if self._task is None:
+            raise RuntimeError("WriteBatcher is not running")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((mutation, args, future))
+        return await future
+
+    async def execute(self, sql, params=()):
+        """Run one statement in the next batch and return the number of affected rows."""
+        return await self.submit(_execute, sql, params)
+
+    def _open(self):
+        self._conn = sqlite3.connect(self.path, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # FULL keeps a committed batch durable even across power loss
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                try:
+                    if remaining > 0:
+                        item = await asyncio.wait_for(self._queue.get(), remaining)
+                    else:
+                        item = self._queue.get_nowait()
+                except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            try:
+                results = await loop.run_in_executor(
+                    self._thread, self._commit, [(m, a) for m, a, _ in batch]
+                )
+            except Exception as e:
+                logger.exception("Write batch of %d failed", len(batch))
+                results = [e] * len(batch)
+
+            for (_, _, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def _commit(self, batch):
+        cur = self._conn.cursor()
+        results = []
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            for mutation, args in batch:
+                cur.execute("SAVEPOINT mutation")
+                try:
+                    results.append(mutation(cur, *args))
+                    cur.execute("RELEASE mutation")
+                except Exception as e:
+                    cur.execute("ROLLBACK TO mutation")
+                    cur.execute("RELEASE mutation")
+                    results.append(e)
+            cur.execute("COMMIT")
+        except Exception:
+            if self._conn.in_transaction:
+                cur.execute("ROLLBACK")
+            raise
+        finally:
+            cur.close()
+        return results
+
+
+def _execute(cur, sql, params):
+    cur.execute(sql, params)
+    return cur.rowcount
@@ -0,0 +1,250 @@
+"""Local stand-in for the Telegram Bot API used by the load test.
+
+Implements just enough of the HTTP API for bot.py to run unmodified:
+getMe, getUpdates, setWebhook/deleteWebhook, sendMessage, sendPhoto,
+sendMediaGroup, editMessageText, answerCallbackQuery, getFile and file
+downloads. Every call is delayed by a random latency and a share of the
+outgoing calls is answered with 429 Too Many Requests, like the real API
+does under load. editMessageText only accepts text messages the server has
+sent, and fails with the real API's 400 errors otherwise.
+
+Updates are pushed with `push_update`; whatever the bot sends to a chat is
+delivered to that chat's outbox queue for the load generator to read.
+"""
+import asyncio
+import base64
+import itertools
+import json
+import random
+import time
+from collections import defaultdict
+
+from aiohttp import web
+
+BOT_USER = {'id': 1000000, 'is_bot': True, 'first_name': 'Debt Bot', 'username': 'debt_bot'}
+
+# 1x1 white PNG served for every downloaded photo
+BLANK_PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAAAAAA6fptVAAAACklEQVR4nGP4DwABAQEAG7buVgAAAABJRU5ErkJggg=='
+)
+
+# Methods that can be rate limited
+OUTGOING_METHODS = {'sendMessage', 'sendPhoto', 'sendMediaGroup', 'editMessageText', 'answerCallbackQuery'}
+
+
+class BadRequest(Exception):
+    """Answered with 400 and the description the real API uses."""
+
+
+class FakeBotApi:
+    def __init__(self, latency_ms=40.0, jitter_ms=20.0, rate_limit_share=0.0, retry_after=1):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit_share = rate_limit_share
+        self.retry_after = retry_after
+
+        self.outboxes = defaultdict(asyncio.Queue)
+        self.polling_started = asyncio.Event()
+        self.calls = defaultdict(int)
+        self.rate_limited = 0
+
+        self._updates = []
+        self._new_update = asyncio.Condition()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._messages = {}  # (chat_id, message_id) -> last sent or edited message
+        self._runner = None
+
+    # Update feed
+
+    async def push_update(self, update):
+        """Queue an update for getUpdates and return its update_id."""
+        update['update_id'] = next(self._update_ids)
+        async with self._new_update:
+            self._updates.append(update)
+            self._new_update.notify_all()
+        return update['update_id']
+
+    async def _get_updates(self, params):
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = float(params.get('timeout') or 0)
+        self.polling_started.set()
+
+        async with self._new_update:
+            self._updates = [u for u in self._updates if u['update_id'] >= offset]
+            if not self._updates and timeout > 0:
+                try:
+                    await asyncio.wait_for(self._new_update.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            return self._updates[:limit]
+
+    # Bot methods
+
+    def message(self, chat_id, **fields):
+        """Build a Message object as the API would return it."""
+        return {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+            **fields,
+        }
+
+    def _deliver(self, chat_id, method, message):
+        """Hand the message to the chat and return it as the API would."""
+        self._messages[chat_id, message['message_id']] = message
+        self.outboxes[chat_id].put_nowait((method, message))
+        # Returned messages only ever carry inline keyboards; reply keyboards
+        # are visible to the user but not echoed back to the bot
+        markup = message.get('reply_markup')
+        if markup is not None and 'inline_keyboard' not in markup:
+            message = {key: value for key, value in message.items() if key != 'reply_markup'}
+        return message
+
+    def _send_message(self, params):
+        chat_id = int(params['chat_id'])
+        fields = {'text': params.get('text', '')}
+        if params.get('reply_markup'):
+            fields['reply_markup'] = params['reply_markup']
+        return self._deliver(chat_id, 'sendMessage', self.message(chat_id, **fields))
+
+    def _send_photo(self, params):
+        chat_id = int(params['chat_id'])
+        photo = params.get('photo')
+        if not isinstance(photo, str):
+            photo = f"uploaded-{next(self._message_ids)}"
+        fields = {'photo': [_photo_size(photo)], 'caption': params.get('caption', '')}
+        if params.get('reply_markup'):
+            fields['reply_markup'] = params['reply_markup']
+        return self._deliver(chat_id, 'sendPhoto', self.message(chat_id, **fields))
+
+    def _send_media_group(self, params):
+        chat_id = int(params['chat_id'])
+        group_id = str(next(self._message_ids))
+        messages = []
+        for media in params.get('media') or []:
+            fields = {'media_group_id': group_id, 'caption': media.get('caption', '')}
+            if media.get('type') == 'photo':
+                fields['photo'] = [_photo_size(str(media.get('media')))]
+            messages.append(self._deliver(chat_id, 'sendMediaGroup', self.message(chat_id, **fields)))
+        return messages
+
+    def _edit_message_text(self, params):
+        chat_id = int(params['chat_id'])
+        message = self._messages.get((chat_id, int(params['message_id'])))
+        if message is None:
+            raise BadRequest("Bad Request: message to edit not found")
+        if 'text' not in message:
+            raise BadRequest("Bad Request: there is no text in the message to edit")
+        message = {key: value for key, value in message.items() if key != 'reply_markup'}
+        message.update(text=params.get('text', ''), edit_date=int(time.time()))
+        if params.get('reply_markup'):
+            message['reply_markup'] = params['reply_markup']
+        return self._deliver(chat_id, 'editMessageText', message)
+
+    def _get_file(self, params):
+        file_id = params['file_id']
+        return {
+            'file_id': file_id,
+            'file_unique_id': file_id,
+            'file_size': len(BLANK_PNG),
+            'file_path': f"photos/{file_id}.png",
+        }
+
+    async def _call(self, method, params):
+        if method == 'getUpdates':
+            return await self._get_updates(params)
+        if method == 'getMe':
+            return BOT_USER
+        if method in ('setWebhook', 'deleteWebhook', 'answerCallbackQuery', 'close', 'logOut'):
+            return True
+        if method == 'sendMessage':
+            return self._send_message(params)
+        if method == 'sendPhoto':
+            return self._send_photo(params)
+        if method == 'sendMediaGroup':
+            return self._send_media_group(params)
+        if method == 'editMessageText':
+            return self._edit_message_text(params)
+        if method == 'getFile':
+            return self._get_file(params)
+        raise KeyError(method)
+
+    # HTTP layer
+
+    async def _latency(self):
+        delay = random.gauss(self.latency_ms, self.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+    async def handle_method(self, request):
+        method = request.match_info['method']
+        self.calls[method] += 1
+        params = await _read_params(request)
+
+        if method != 'getUpdates':
+            await self._latency()
+        if method in OUTGOING_METHODS and random.random() < self.rate_limit_share:
+            self.rate_limited += 1
+            return web.json_response({
+                'ok': False,
+                'error_code': 429,
+                'description': f"Too Many Requests: retry after {self.retry_after}",
+                'parameters': {'retry_after': self.retry_after},
+            }, status=429)
+
+        try:
+            result = await self._call(method, params)
+        except KeyError:
+            return web.json_response(
+                {'ok': False, 'error_code': 404, 'description': 'Not Found'}, status=404
+            )
+        except BadRequest as e:
+            return web.json_response(
+                {'ok': False, 'error_code': 400, 'description': str(e)}, status=400
+            )
+        return web.json_response({'ok': True, 'result': result})
+
+    async def handle_file(self, request):
+        await self._latency()
+        return web.Response(body=BLANK_PNG, content_type='image/png')
+
+    def app(self):
+        app = web.Application(client_max_size=20 * 1024 * 1024)
+        app.router.add_route('*', '/bot{token}/{method}', self.handle_method)
+        app.router.add_get('/file/bot{token}/{path:.+}', self.handle_file)
+        return app
+
+    async def start(self, host='127.0.0.1', port=8081):
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def _photo_size(file_id):
+    return {'file_id': file_id, 'file_unique_id': file_id, 'width': 1, 'height': 1,
+            'file_size': len(BLANK_PNG)}
+
+
+async def _read_params(request):
+    """Collect parameters from the query string and a form or JSON body."""
+    params = dict(request.query)
+    if request.content_type == 'application/json':
+        params.update(await request.json())
+    elif request.can_read_body:
+        form = await request.post()
+        for key, value in form.items():
+            params[key] = value if isinstance(value, str) else value.file.read()
+
+    # python-telegram-bot sends objects as JSON encoded form fields
+    for key in ('reply_markup', 'media', 'allowed_updates'):
+        if isinstance(params.get(key), str):
+            params[key] = json.loads(params[key])
+    return params
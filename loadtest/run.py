@@ -0,0 +1,253 @@
+"""End-to-end load test of bot.py against the local fake Bot API.
+
+Starts the fake API server, launches bot.py against it with a fresh
+database, and replays scripted operator sessions (add client, add receipt,
+view receipts, overdue debts, delete receipt) across many simulated chats.
+Reports throughput and p50/p99 latency per step.
+
+Run from the repository root:
+
+    pip install -r loadtest/requirements.txt
+    python -m loadtest.run --chats 2000 --concurrency 200 --rate-limit 0.005
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from loadtest.fake_bot_api import FakeBotApi
+
+ROOT = Path(__file__).resolve().parent.parent
+BOT_TOKEN = '123456:LOADTEST'
+
+
+class StepFailed(Exception):
+    pass
+
+
+def inline_buttons(message):
+    markup = message.get('reply_markup') or {}
+    for row in markup.get('inline_keyboard', []):
+        yield from row
+
+
+def has_main_keyboard(message):
+    return 'keyboard' in (message.get('reply_markup') or {})
+
+
+def has_inline_keyboard(message):
+    return any(True for _ in inline_buttons(message))
+
+
+def is_error(message):
+    return 'Произошла ошибка' in (message.get('text') or '')
+
+
+class Session:
+    """One simulated operator working in its own private chat."""
+
+    _callback_ids = itertools.count(1)
+
+    def __init__(self, api, chat_id, stats, step_timeout):
+        self.api = api
+        self.chat_id = chat_id
+        self.stats = stats
+        self.step_timeout = step_timeout
+        self.user = {'id': chat_id, 'is_bot': False, 'first_name': f"Operator {chat_id}"}
+        self.outbox = api.outboxes[chat_id]
+        self.client_name = f"Клиент {chat_id}"
+        self.phone = f"+7900{chat_id:07d}"
+
+    # Update builders
+
+    def _message(self, **fields):
+        return {'message': {
+            'message_id': 0,
+            'date': int(time.time()),
+            'chat': {'id': self.chat_id, 'type': 'private', 'first_name': self.user['first_name']},
+            'from': self.user,
+            **fields,
+        }}
+
+    def text(self, text):
+        return self._message(text=text)
+
+    def photo(self):
+        file_id = f"photo-{self.chat_id}-{random.getrandbits(32)}"
+        return self._message(photo=[{'file_id': file_id, 'file_unique_id': file_id,
+                                     'width': 1280, 'height': 960, 'file_size': 150000}])
+
+    def callback(self, message, data):
+        return {'callback_query': {
+            'id': str(next(self._callback_ids)),
+            'from': self.user,
+            'chat_instance': str(self.chat_id),
+            'message': message,
+            'data': data,
+        }}
+
+    # Steps
+
+    async def step(self, name, update, done):
+        """Send an update and wait until the bot sends a message matching `done`."""
+        while not self.outbox.empty():
+            self.outbox.get_nowait()
+
+        start = time.perf_counter()
+        await self.api.push_update(update)
+        deadline = start + self.step_timeout
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise StepFailed(f"{name}: timed out")
+            try:
+                method, message = await asyncio.wait_for(self.outbox.get(), remaining)
+            except asyncio.TimeoutError:
+                raise StepFailed(f"{name}: timed out") from None
+            if is_error(message):
+                raise StepFailed(f"{name}: bot replied with an error")
+            if done(method, message):
+                self.stats[name].append(time.perf_counter() - start)
+                return message
+
+    def button(self, message, prefix, label=None):
+        for button in inline_buttons(message):
+            data = button.get('callback_data', '')
+            if data.startswith(prefix) and (label is None or label in button.get('text', '')):
+                return data
+        raise StepFailed(f"no {prefix} button for {label or 'any'}")
+
+    async def add_client(self):
+        await self.step('add_client.start', self.text("👤 Добавить клиента"), lambda m, msg: True)
+        await self.step('add_client.name', self.text(self.client_name), lambda m, msg: True)
+        await self.step('add_client.phone', self.text(self.phone), lambda m, msg: has_main_keyboard(msg))
+
+    async def add_receipt(self):
+        menu = await self.step('add_receipt.start', self.text("📄 Добавить чек"),
+                               lambda m, msg: has_inline_keyboard(msg))
+        data = self.button(menu, 'client_', self.phone)
+        await self.step('add_receipt.client', self.callback(menu, data), lambda m, msg: True)
+        await self.step('add_receipt.photo', self.photo(), lambda m, msg: True)
+        await self.step('add_receipt.amount', self.text(f"{random.randint(100, 99999) / 100:.2f}"),
+                        lambda m, msg: True)
+        await self.step('add_receipt.days', self.text(str(random.randint(1, 30))),
+                        lambda m, msg: has_main_keyboard(msg))
+
+    async def view_receipts(self):
+        menu = await self.step('view.start', self.text("👁 Просмотр чеков"),
+                               lambda m, msg: has_inline_keyboard(msg))
+        data = self.button(menu, 'view_', self.phone)
+        await self.step('view.client', self.callback(menu, data), lambda m, msg: has_main_keyboard(msg))
+
+    async def overdue(self):
+        await self.step('overdue', self.text("⏰ Просроченные долги"), lambda m, msg: has_main_keyboard(msg))
+
+    async def delete_receipt(self):
+        menu = await self.step('delete.start', self.text("🗑 Удаление чеков"),
+                               lambda m, msg: has_inline_keyboard(msg))
+        data = self.button(menu, 'del_client_', self.phone)
+        photo = await self.step('delete.client', self.callback(menu, data),
+                                lambda m, msg: m == 'sendPhoto' and has_inline_keyboard(msg))
+        data = self.button(photo, 'delete_receipt_')
+        await self.step('delete.receipt', self.callback(photo, data), lambda m, msg: m == 'editMessageText')
+
+    async def run(self):
+        await self.add_client()
+        await self.add_receipt()
+        await self.view_receipts()
+        await self.overdue()
+        await self.delete_receipt()
+
+
+def percentile(values, share):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(share * len(values)) - 1))
+    return values[index]
+
+
+def report(stats, failures, elapsed, sessions, api):
+    steps = sum(len(v) for v in stats.values())
+    print(f"\nSessions: {sessions - len(failures)} ok, {len(failures)} failed in {elapsed:.1f} s")
+    print(f"Throughput: {(sessions - len(failures)) / elapsed:.1f} sessions/s, {steps / elapsed:.1f} steps/s")
+    print(f"Bot API calls: {sum(api.calls.values())}, rate limited: {api.rate_limited}\n")
+
+    print(f"{'step':<22}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    everything = []
+    for name, values in stats.items():
+        everything.extend(values)
+        print(f"{name:<22}{len(values):>8}{percentile(values, 0.5) * 1000:>10.1f}"
+              f"{percentile(values, 0.99) * 1000:>10.1f}{statistics.fmean(values) * 1000:>10.1f}")
+    if everything:
+        print(f"{'all':<22}{len(everything):>8}{percentile(everything, 0.5) * 1000:>10.1f}"
+              f"{percentile(everything, 0.99) * 1000:>10.1f}{statistics.fmean(everything) * 1000:>10.1f}")
+
+    reasons = defaultdict(int)
+    for reason in failures:
+        reasons[reason] += 1
+    for reason, count in sorted(reasons.items(), key=lambda item: -item[1])[:10]:
+        print(f"failed x{count}: {reason}")
+
+
+async def main(args):
+    api = FakeBotApi(args.latency_ms, args.jitter_ms, args.rate_limit)
+    await api.start(port=args.port)
+
+    workdir = tempfile.mkdtemp(prefix='debt-bot-loadtest-')
+    env = dict(os.environ, BOT_TOKEN=BOT_TOKEN, BOT_API_BASE_URL=f"http://127.0.0.1:{args.port}")
+    log = open(os.path.join(workdir, 'bot.log'), 'wb')
+    bot = subprocess.Popen([sys.executable, str(ROOT / 'bot.py')], cwd=workdir, env=env,
+                           stdout=log, stderr=subprocess.STDOUT)
+    print(f"Bot started, working directory {workdir}")
+
+    try:
+        await asyncio.wait_for(api.polling_started.wait(), args.startup_timeout)
+
+        stats = defaultdict(list)
+        failures = []
+        slots = asyncio.Semaphore(args.concurrency)
+
+        async def run_session(chat_id):
+            async with slots:
+                try:
+                    await Session(api, chat_id, stats, args.step_timeout).run()
+                except StepFailed as e:
+                    failures.append(str(e))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(run_session(args.first_chat + i) for i in range(args.chats)))
+        report(stats, failures, time.perf_counter() - start, args.chats, api)
+    finally:
+        bot.terminate()
+        try:
+            bot.wait(10)
+        except subprocess.TimeoutExpired:
+            bot.kill()
+        log.close()
+        await api.stop()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chats', type=int, default=1000, help='simulated operator chats')
+    parser.add_argument('--concurrency', type=int, default=100, help='sessions running at once')
+    parser.add_argument('--first-chat', type=int, default=100000)
+    parser.add_argument('--latency-ms', type=float, default=40.0, help='mean Bot API latency')
+    parser.add_argument('--jitter-ms', type=float, default=20.0)
+    parser.add_argument('--rate-limit', type=float, default=0.0,
+                        help='share of outgoing calls answered with 429')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--step-timeout', type=float, default=30.0)
+    parser.add_argument('--startup-timeout', type=float, default=60.0)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,139 @@
+import contextvars
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+from datetime import datetime, timezone
+
+# Logging settings
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', 0.01))
+LOG_SLOW_HANDLER_MS = float(os.getenv('LOG_SLOW_HANDLER_MS', 500))
+
+# Correlation fields attached to every record
+CONTEXT_FIELDS = ('update_id', 'chat_id', 'user_id', 'handler')
+_context = {name: contextvars.ContextVar(name, default=None) for name in CONTEXT_FIELDS}
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+logger = logging.getLogger(__name__)
+
+
+class ContextFilter(logging.Filter):
+    """Copy the current update correlation ids onto the record."""
+
+    def filter(self, record):
+        for name, var in _context.items():
+            if not hasattr(record, name):
+                setattr(record, name, var.get())
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Let through only a share of DEBUG records; higher levels always pass."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """Render records as one JSON object per line."""
+
+    def format(self, record):
+        data = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and value is not None:
+                data[key] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class LoopQueueHandler(logging.handlers.QueueHandler):
+    """Queue records without rendering them on the event loop.
+
+    The listener lives in a thread of the same process, so records do not
+    have to be pickled: message formatting and traceback rendering are left
+    to the listener thread.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def setup_logging(level=LOG_LEVEL, debug_sample_rate=LOG_DEBUG_SAMPLE_RATE):
+    """Route all logging through a queue to a background JSON writer.
+
+    Returns the started QueueListener; stop it on shutdown to flush.
+    """
+    log_queue = queue.SimpleQueue()
+
+    queue_handler = LoopQueueHandler(log_queue)
+    queue_handler.addFilter(DebugSamplingFilter(debug_sample_rate))
+    queue_handler.addFilter(ContextFilter())
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JsonFormatter())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    # One INFO line per Bot API request is too much
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def log_handler(func):
+    """Bind update correlation ids to the log context of a handler.
+
+    Also records how long the handler took and the conversation state it
+    returned; slow handlers are reported at INFO, the rest at sampled DEBUG.
+    """
+    @functools.wraps(func)
+    async def wrapper(update, context):
+        chat = getattr(update, 'effective_chat', None)
+        user = getattr(update, 'effective_user', None)
+        tokens = [
+            (_context['update_id'], _context['update_id'].set(getattr(update, 'update_id', None))),
+            (_context['chat_id'], _context['chat_id'].set(chat.id if chat else None)),
+            (_context['user_id'], _context['user_id'].set(user.id if user else None)),
+            (_context['handler'], _context['handler'].set(func.__name__)),
+        ]
+        start = time.perf_counter()
+        try:
+            result = await func(update, context)
+            duration_ms = (time.perf_counter() - start) * 1000
+            level = logging.INFO if duration_ms >= LOG_SLOW_HANDLER_MS else logging.DEBUG
+            if logger.isEnabledFor(level):
+                logger.log(level, "Handled update", extra={
+                    'duration_ms': round(duration_ms, 2),
+                    'next_state': result,
+                })
+            return result
+        finally:
+            for var, token in reversed(tokens):
+                var.reset(token)
+
+    return wrapper
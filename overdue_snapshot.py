@@ -0,0 +1,175 @@
+import heapq
+from datetime import datetime, timedelta
+
+# Telegram message length limit
+MESSAGE_LIMIT = 4096
+
+REPORT_HEADER = "⚠️ Просроченные долги:\n\n"
+
+
+class OverdueSnapshot:
+    """In-memory view of overdue debts kept in step with the database.
+
+    Holds every receipt with its due date, payments per client and the
+    rendered report section of each client. A min-heap keeps the next
+    moment the report changes for each receipt: its due date, or for an
+    overdue receipt the moment its "days overdue" counter goes up. Only
+    the sections of clients touched by such a change are re-rendered.
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._clients = {}      # client_id -> (name, phone)
+        self._paid = {}         # client_id -> total paid
+        self._receipts = {}     # receipt_id -> (client_id, amount, date_added, due_date)
+        self._by_client = {}    # client_id -> set of receipt_ids
+        self._next_change = {}  # receipt_id -> time of its live heap entry
+        self._heap = []         # (time, receipt_id)
+        self._sections = {}     # client_id -> rendered section, for clients with overdue debt
+        self._dirty = set()     # client_ids whose section must be re-rendered
+        self._chunks = []
+
+    def load(self, conn, now=None):
+        """Rebuild the snapshot from the database."""
+        self._reset()
+        cur = conn.cursor()
+        cur.execute("SELECT id, name, phone FROM clients")
+        for client_id, name, phone in cur.fetchall():
+            self._clients[client_id] = (name, phone)
+        cur.execute("SELECT client_id, SUM(amount) FROM payments GROUP BY client_id")
+        for client_id, paid in cur.fetchall():
+            self._paid[client_id] = paid or 0
+        cur.execute("SELECT id, client_id, amount, date_added, debt_days FROM receipts")
+        now = now or datetime.now()
+        for receipt_id, client_id, amount, date_added, debt_days in cur.fetchall():
+            self._add(receipt_id, client_id, amount, date_added, debt_days, now)
+        cur.close()
+
+    # Incremental updates; each returns True if the report changed
+
+    def client_added(self, client_id, name, phone):
+        # A new client has no receipts, so nothing of theirs is overdue yet
+        self._clients[client_id] = (name, phone)
+        return False
+
+    def receipt_added(self, receipt_id, client_id, amount, date_added, debt_days, now=None):
+        now = now or datetime.now()
+        return self._add(receipt_id, client_id, amount, date_added, debt_days, now)
+
+    def receipt_removed(self, receipt_id, now=None):
+        now = now or datetime.now()
+        receipt = self._receipts.pop(receipt_id, None)
+        if receipt is None:
+            return False
+        client_id, _, _, due_date = receipt
+        self._by_client[client_id].discard(receipt_id)
+        self._next_change.pop(receipt_id, None)
+        return self._touch(client_id, due_date < now)
+
+    def payment_added(self, client_id, amount, now=None):
+        now = now or datetime.now()
+        self._paid[client_id] = self._paid.get(client_id, 0) + amount
+        overdue = any(self._receipts[r][3] < now for r in self._by_client.get(client_id, ()))
+        return self._touch(client_id, overdue)
+
+    def _add(self, receipt_id, client_id, amount, date_added, debt_days, now):
+        if isinstance(date_added, str):
+            date_added = datetime.fromisoformat(date_added)
+        due_date = date_added + timedelta(days=debt_days)
+        self._receipts[receipt_id] = (client_id, amount, date_added, due_date)
+        self._by_client.setdefault(client_id, set()).add(receipt_id)
+        self._schedule(receipt_id, due_date, now)
+        return self._touch(client_id, due_date < now)
+
+    def _touch(self, client_id, changed):
+        if changed:
+            self._dirty.add(client_id)
+        return changed
+
+    def _schedule(self, receipt_id, due_date, now):
+        # A receipt is overdue once now > due_date, i.e. from the next
+        # microsecond on; its day counter goes up exactly at due_date + N days
+        if now > due_date:
+            when = due_date + timedelta(days=(now - due_date).days + 1)
+        else:
+            when = due_date + timedelta(microseconds=1)
+        self._next_change[receipt_id] = when
+        heapq.heappush(self._heap, (when, receipt_id))
+
+    # Time
+
+    def advance(self, now):
+        """Apply due dates and overdue day changes that happened up to `now`."""
+        while self._heap and self._heap[0][0] <= now:
+            when, receipt_id = heapq.heappop(self._heap)
+            if self._next_change.get(receipt_id) != when:
+                continue  # receipt removed or rescheduled
+            client_id, _, _, due_date = self._receipts[receipt_id]
+            self._schedule(receipt_id, due_date, now)
+            self._dirty.add(client_id)
+
+    def next_change(self):
+        """Time of the next due date or overdue day change, or None."""
+        while self._heap:
+            when, receipt_id = self._heap[0]
+            if self._next_change.get(receipt_id) == when:
+                return when
+            heapq.heappop(self._heap)
+        return None
+
+    # Report
+
+    def render(self, now=None):
+        """Return the overdue report split into messages; empty if nothing is overdue."""
+        now = now or datetime.now()
+        self.advance(now)
+        if self._dirty:
+            for client_id in self._dirty:
+                section = self._render_client(client_id, now)
+                if section:
+                    self._sections[client_id] = section
+                else:
+                    self._sections.pop(client_id, None)
+            self._dirty.clear()
+            self._chunks = self._join()
+        return self._chunks
+
+    def _render_client(self, client_id, now):
+        """Render one client's part of the report, or None if nothing is owed."""
+        debts = sorted(
+            (date_added, amount, (now - due_date).days)
+            for _, amount, date_added, due_date in (
+                self._receipts[r] for r in self._by_client.get(client_id, ())
+            )
+            if due_date < now
+        )
+        if not debts:
+            return None
+        total_debt = sum(amount for _, amount, _ in debts)
+        paid = self._paid.get(client_id, 0)
+        remaining_debt = total_debt - paid
+        if remaining_debt <= 0:
+            return None
+
+        name, phone = self._clients.get(client_id, ('?', '?'))
+        section = (
+            f"👤 Клиент: {name}\n"
+            f"📱 Телефон: {phone}\n"
+            f"💰 Общий долг: {total_debt:.2f} руб.\n"
+            f"💵 Оплачено: {paid:.2f} руб.\n"
+            f"📊 Остаток: {remaining_debt:.2f} руб.\n\n"
+            "Просроченные чеки:\n"
+        )
+        for _, amount, days_overdue in debts:
+            section += f"- {amount:.2f} руб. (просрочка {days_overdue} дней)\n"
+        return section + "\n"
+
+    def _join(self):
+        if not self._sections:
+            return []
+        # Clients may share a name; the id keeps their order stable
+        order = sorted(self._sections, key=lambda c: (self._clients.get(c, ('', ''))[0], c))
+        message = REPORT_HEADER + "".join(self._sections[c] for c in order)
+        return [message[x:x + MESSAGE_LIMIT] for x in range(0, len(message), MESSAGE_LIMIT)]
@@ -0,0 +1,187 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+# Pool settings
+OCR_WORKERS = int(os.getenv('OCR_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+OCR_MAX_PENDING = int(os.getenv('OCR_MAX_PENDING', OCR_WORKERS * 4))
+OCR_TIMEOUT = float(os.getenv('OCR_TIMEOUT', 10))
+OCR_LANG = os.getenv('OCR_LANG', 'rus+eng')
+
+# Lines that usually carry the receipt total
+TOTAL_KEYWORDS = ('итог', 'всего', 'к оплате', 'сумма', 'total')
+AMOUNT_RE = re.compile(r'(\d{1,3}(?:[ \u00a0]\d{3})+|\d+)(?:[.,](\d{1,2}))?(?!\d)')
+# Dates and times are stripped before amounts are looked up
+DATE_TIME_RE = re.compile(r'\d{1,2}[./-]\d{1,2}[./-]\d{2,4}|\d{1,2}:\d{2}(?::\d{2})?')
+# So are phone numbers and long digit runs (ИНН, ФН, ФД, card numbers)
+NOT_MONEY_RE = re.compile(
+    r'\+\d[\d \u00a0()-]*\d'            # +7 900 123-45-67
+    r'|\d+(?:-\d+){2,}'                  # 900-123-45-67
+    r'|\d{7,}(?![.,]\d)'                 # 7707083893
+)
+
+_executor = None
+_slots = None
+_workers = OCR_WORKERS
+
+
+def parse_amount(token):
+    """Convert a matched amount like '1 234,50' to float."""
+    whole, fraction = token
+    value = float(whole.replace(' ', '').replace('\u00a0', ''))
+    if fraction:
+        value += float(f"0.{fraction}")
+    return value
+
+
+def find_amounts(line):
+    """Return (value, has_fraction) for every money-like token in a line."""
+    line = NOT_MONEY_RE.sub(' ', DATE_TIME_RE.sub(' ', line))
+    amounts = []
+    for token in AMOUNT_RE.findall(line):
+        value = parse_amount(token)
+        if 0 < value < 10_000_000:
+            amounts.append((value, bool(token[1])))
+    return amounts
+
+
+def best_amount(amounts):
+    """Prefer amounts with kopecks over bare integers such as quantities."""
+    with_fraction = [value for value, has_fraction in amounts if has_fraction]
+    return max(with_fraction or [value for value, _ in amounts])
+
+
+def find_total(text):
+    """Pick the receipt total from recognized text.
+
+    Amounts on lines with a total keyword win; otherwise the largest
+    amount on the receipt is taken. Amounts with kopecks are preferred over
+    bare integers. Returns None if nothing looks like money.
+    """
+    keyword_amounts = []
+    all_amounts = []
+    for line in text.splitlines():
+        amounts = find_amounts(line)
+        if not amounts:
+            continue
+        all_amounts.extend(amounts)
+        if any(word in line.lower() for word in TOTAL_KEYWORDS):
+            keyword_amounts.extend(amounts)
+
+    if keyword_amounts:
+        return best_amount(keyword_amounts)
+    if all_amounts:
+        return best_amount(all_amounts)
+    return None
+
+
+def _warm_up(_=None):
+    """Import the OCR libraries once per worker process."""
+    import pytesseract  # noqa: F401
+    from PIL import Image  # noqa: F401
+    return os.getpid()
+
+
+def extract_total(image_bytes, lang=OCR_LANG):
+    """Run Tesseract on a receipt photo and return the detected total.
+
+    Executed inside the worker process, never on the event loop.
+    """
+    import pytesseract
+    from PIL import Image, ImageOps
+
+    image = Image.open(io.BytesIO(image_bytes))
+    image = ImageOps.grayscale(image)
+    text = pytesseract.image_to_string(image, lang=lang)
+    return find_total(text)
+
+
+def _new_executor(workers):
+    """Create a pool with warm-up jobs queued for every worker."""
+    # The bot already runs the log listener and db writer threads; forking
+    # the whole process would copy their locks in whatever state they are in.
+    executor = ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context('forkserver')
+    )
+    warm = [executor.submit(_warm_up) for _ in range(workers)]
+    return executor, warm
+
+
+async def start_pool(workers=OCR_WORKERS):
+    """Create the worker pool and load the OCR libraries in every worker."""
+    global _executor, _slots, _workers
+    if _executor is not None:
+        return _executor
+
+    _workers = workers
+    _executor, warm = _new_executor(workers)
+    _slots = asyncio.Semaphore(OCR_MAX_PENDING)
+    for future in warm:
+        try:
+            await asyncio.wait_for(asyncio.wrap_future(future), 30)
+        except Exception:
+            logger.warning("OCR worker warm-up failed", exc_info=True)
+    logger.info("OCR pool started with %d workers", workers)
+    return _executor
+
+
+def _restart_pool(broken):
+    """Replace a pool whose worker died; later calls get a working pool again."""
+    global _executor
+    if _executor is not broken:
+        return  # another call already replaced it
+    logger.warning("OCR pool is broken, starting a new one")
+    broken.shutdown(wait=False, cancel_futures=True)
+    _executor, _ = _new_executor(_workers)
+
+
+def stop_pool():
+    """Shut the worker pool down."""
+    global _executor, _slots
+    if _executor is None:
+        return
+    _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+    _slots = None
+
+
+async def recognize_total(image_bytes, timeout=OCR_TIMEOUT):
+    """Detect the receipt total without blocking the event loop.
+
+    Returns None when the pool is not running, too many photos are
+    already queued, recognition fails or it takes longer than `timeout`.
+    """
+    if _executor is None:
+        return None
+    if _slots.locked():
+        logger.info("OCR queue is full, skipping recognition")
+        return None
+
+    slots = _slots
+    executor = _executor
+    await slots.acquire()
+    try:
+        future = asyncio.wrap_future(executor.submit(extract_total, bytes(image_bytes)))
+    except BrokenProcessPool:
+        slots.release()
+        _restart_pool(executor)
+        return None
+    # The slot is held until the worker is really done, even after a timeout,
+    # so abandoned jobs still count against the queue limit.
+    future.add_done_callback(lambda f: (f.cancelled() or f.exception(), slots.release()))
+    try:
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+    except asyncio.TimeoutError:
+        logger.info("OCR timed out after %.1f s", timeout)
+    except BrokenProcessPool:
+        _restart_pool(executor)
+    except Exception:
+        logger.warning("OCR failed", exc_info=True)
+    return None
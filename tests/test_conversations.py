@@ -0,0 +1,115 @@
+"""Conversations that are open at the same time keep their own user_data."""
+import asyncio
+import sqlite3
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+pytest.importorskip('telegram')
+
+import bot  # noqa: E402
+from db_writer import WriteBatcher  # noqa: E402
+from overdue_snapshot import OverdueSnapshot  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    path = str(tmp_path / 'debt_bot.db')
+    monkeypatch.setattr(bot, 'DB_PATH', path)
+    monkeypatch.setattr(bot, 'db_writer', WriteBatcher(path))
+    monkeypatch.setattr(bot, 'overdue', OverdueSnapshot())
+    bot.init_db()
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO clients VALUES (1, 'Анна', '+79000000001')")
+    conn.execute("INSERT INTO receipts VALUES (1, 1, 'photo-1', 500.0, 7, ?)", (str(datetime.now()),))
+    conn.commit()
+    conn.close()
+    return path
+
+
+def message_update(text=None, photo=None):
+    message = MagicMock(text=text, photo=photo)
+    message.reply_text = AsyncMock()
+    return SimpleNamespace(update_id=1, effective_chat=SimpleNamespace(id=42), effective_user=None,
+                           message=message, callback_query=None)
+
+
+def callback_update(data):
+    query = MagicMock(data=data)
+    query.answer = AsyncMock()
+    query.edit_message_text = AsyncMock()
+    query.message.chat_id = 42
+    return SimpleNamespace(update_id=1, effective_chat=SimpleNamespace(id=42), effective_user=None,
+                           message=None, callback_query=query)
+
+
+def make_context():
+    job_queue = MagicMock()
+    job_queue.get_jobs_by_name.return_value = []
+    # The OCR suggestion is not part of these tests
+    application = SimpleNamespace(create_task=lambda coroutine, update=None: coroutine.close())
+    return SimpleNamespace(user_data={}, bot=AsyncMock(), job_queue=job_queue, application=application)
+
+
+def test_ending_one_flow_keeps_the_other(db):
+    async def run():
+        await bot.db_writer.start()
+        try:
+            context = make_context()
+            photo = [SimpleNamespace(file_id='photo-2')]
+
+            # Start adding a receipt and stop at the photo upload
+            assert await bot.add_receipt_start(message_update(), context) == bot.SELECTING_CLIENT_FOR_RECEIPT
+            assert await bot.select_client_for_receipt(callback_update('client_1'), context) == bot.UPLOADING_RECEIPT
+
+            # Meanwhile view the client's receipts...
+            assert await bot.view_receipts_start(message_update(), context) == bot.SELECTING_CLIENT_FOR_VIEW
+            assert set(context.user_data) == {bot.ADD_RECEIPT_FLOW, bot.VIEW_RECEIPTS_FLOW}
+            end = await bot.show_client_receipts(callback_update('view_1'), context)
+            assert end == bot.ConversationHandler.END
+            assert set(context.user_data) == {bot.ADD_RECEIPT_FLOW}
+
+            # ...and let an abandoned delete flow time out
+            await bot.delete_receipt_start(message_update(), context)
+            await bot.show_receipts_for_delete(callback_update('del_client_1'), context)
+            assert context.user_data[bot.DELETE_RECEIPT_FLOW] == {'selected_client_id': 1}
+            timed_out = bot.timeout_handler(bot.DELETE_RECEIPT_FLOW).callback
+            assert await timed_out(message_update(), context) == bot.ConversationHandler.END
+            assert set(context.user_data) == {bot.ADD_RECEIPT_FLOW}
+
+            # The receipt flow still finishes with its own data
+            assert await bot.handle_receipt_photo(message_update(photo=photo), context) == bot.ADDING_RECEIPT_AMOUNT
+            assert await bot.add_receipt_amount(message_update('150,50'), context) == bot.ADDING_DEBT_DAYS
+            reply = message_update('7')
+            assert await bot.add_receipt_days(reply, context) == bot.ConversationHandler.END
+            assert 'Чек успешно добавлен' in reply.message.reply_text.call_args.args[0]
+            assert context.user_data == {}
+        finally:
+            await bot.db_writer.stop()
+
+    asyncio.run(run())
+
+    conn = sqlite3.connect(db)
+    assert conn.execute("SELECT client_id, photo_id, amount FROM receipts WHERE id = 2").fetchone() == \
+        (1, 'photo-2', 150.5)
+    conn.close()
+
+
+def test_sweep_evicts_flows_of_idle_users():
+    now = bot.time.monotonic()
+    user_data = {
+        1: {'last_activity': now - bot.CONVERSATION_TIMEOUT - 1, bot.ADD_RECEIPT_FLOW: {}},
+        2: {'last_activity': now - bot.CONVERSATION_TIMEOUT - 1, bot.VIEW_RECEIPTS_FLOW: {}, 'lang': 'ru'},
+        3: {'last_activity': now, bot.ADD_CLIENT_FLOW: {'client_name': 'Анна'}, bot.VIEW_RECEIPTS_FLOW: {}},
+    }
+    application = MagicMock(user_data=user_data)
+    application.drop_user_data.side_effect = user_data.pop
+
+    asyncio.run(bot.evict_stale_user_data(SimpleNamespace(application=application)))
+
+    assert user_data == {
+        2: {'last_activity': user_data[2]['last_activity'], 'lang': 'ru'},
+        3: {'last_activity': now, bot.ADD_CLIENT_FLOW: {'client_name': 'Анна'}, bot.VIEW_RECEIPTS_FLOW: {}},
+    }
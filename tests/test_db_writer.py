@@ -0,0 +1,123 @@
+"""WriteBatcher: savepoints per mutation, results only after COMMIT, clean shutdown."""
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from db_writer import WriteBatcher
+
+INSERT = "INSERT INTO receipts (client_id, amount) VALUES (?, ?)"
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / 'debt_bot.db')
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE clients (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL);
+        CREATE TABLE receipts (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                               client_id INTEGER REFERENCES clients (id) DEFERRABLE INITIALLY DEFERRED,
+                               amount REAL);
+    ''')
+    conn.close()
+    return path
+
+
+def amounts(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [amount for amount, in conn.execute("SELECT amount FROM receipts ORDER BY id")]
+    finally:
+        conn.close()
+
+
+def insert_then_fail(cur, amount):
+    cur.execute(INSERT, (None, amount))
+    raise ValueError("bad receipt")
+
+
+def test_failing_mutation_is_rolled_back_alone(path):
+    async def run():
+        writer = WriteBatcher(path, window=0.1)
+        await writer.start()
+        try:
+            return await asyncio.gather(
+                writer.execute(INSERT, (None, 1.0)),
+                writer.submit(insert_then_fail, 2.0),
+                writer.execute(INSERT, (None, 3.0)),
+                return_exceptions=True,
+            )
+        finally:
+            await writer.stop()
+
+    first, failed, last = asyncio.run(run())
+    assert (first, last) == (1, 1)
+    assert isinstance(failed, ValueError)
+    assert amounts(path) == [1.0, 3.0]
+
+
+def test_result_arrives_after_commit(path):
+    async def run():
+        writer = WriteBatcher(path)
+        await writer.start()
+        other = sqlite3.connect(path)
+        seen = []
+        try:
+            task = asyncio.create_task(writer.execute(INSERT, (None, 1.0)))
+            # Runs as soon as the caller could see its result
+            task.add_done_callback(
+                lambda _: seen.append(other.execute("SELECT COUNT(*) FROM receipts").fetchone()[0])
+            )
+            assert await task == 1
+        finally:
+            other.close()
+            await writer.stop()
+        return seen
+
+    assert asyncio.run(run()) == [1]
+
+
+class ForeignKeyWriter(WriteBatcher):
+    def _open(self):
+        super()._open()
+        self._conn.execute("PRAGMA foreign_keys=ON")
+
+
+def test_failed_commit_fails_the_whole_batch(path):
+    async def run():
+        writer = ForeignKeyWriter(path, window=0.1)
+        await writer.start()
+        try:
+            # The deferred foreign key is only checked by COMMIT
+            results = await asyncio.gather(
+                writer.execute("INSERT INTO clients (name) VALUES ('Анна')"),
+                writer.execute(INSERT, (999, 1.0)),
+                writer.execute(INSERT, (None, 2.0)),
+                return_exceptions=True,
+            )
+            # The writer keeps going after a failed batch
+            after = await writer.execute(INSERT, (None, 3.0))
+        finally:
+            await writer.stop()
+        return results, after
+
+    results, after = asyncio.run(run())
+    assert all(isinstance(result, sqlite3.IntegrityError) for result in results)
+    assert after == 1
+    assert amounts(path) == [3.0]
+
+
+def test_stop_commits_queued_work(path):
+    async def run():
+        writer = WriteBatcher(path, window=10)
+        await writer.start()
+        tasks = [asyncio.create_task(writer.execute(INSERT, (None, float(i)))) for i in range(5)]
+        await asyncio.sleep(0)
+        start = time.monotonic()
+        await writer.stop()
+        assert time.monotonic() - start < 5  # not held up by the batching window
+        return [task.result() for task in tasks]
+
+    assert asyncio.run(run()) == [1] * 5
+    assert amounts(path) == [0.0, 1.0, 2.0, 3.0, 4.0]
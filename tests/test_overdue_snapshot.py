@@ -0,0 +1,177 @@
+"""OverdueSnapshot must render exactly what the old overdue query produced."""
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from overdue_snapshot import OverdueSnapshot, REPORT_HEADER
+
+BASE = datetime(2026, 10, 1, 12, 0, 0, 500000)
+
+
+def old_overdue_report(conn, current_time):
+    """The query and formatting show_overdue_debts used before the snapshot."""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT
+            c.name, c.phone,
+            r.amount, r.date_added, r.debt_days,
+            COALESCE((
+                SELECT SUM(amount)
+                FROM payments p
+                WHERE p.client_id = c.id
+            ), 0) as paid_amount
+        FROM receipts r
+        JOIN clients c ON r.client_id = c.id
+        WHERE datetime(r.date_added, '+' || r.debt_days || ' days') < ?
+        ORDER BY c.name, r.date_added
+    """, (current_time,))
+    overdue = cur.fetchall()
+    cur.close()
+
+    client_debts = {}
+    for name, phone, amount, date_added, days, paid_amount in overdue:
+        if name not in client_debts:
+            client_debts[name] = {'phone': phone, 'total_debt': 0, 'paid': paid_amount, 'debts': []}
+        due_date = datetime.strptime(date_added, '%Y-%m-%d %H:%M:%S.%f') + timedelta(days=days)
+        client_debts[name]['total_debt'] += amount
+        client_debts[name]['debts'].append({
+            'amount': amount,
+            'days_overdue': (current_time - due_date).days,
+        })
+
+    message = REPORT_HEADER
+    for client_name, data in client_debts.items():
+        remaining_debt = data['total_debt'] - data['paid']
+        if remaining_debt <= 0:
+            continue
+        message += f"👤 Клиент: {client_name}\n"
+        message += f"📱 Телефон: {data['phone']}\n"
+        message += f"💰 Общий долг: {data['total_debt']:.2f} руб.\n"
+        message += f"💵 Оплачено: {data['paid']:.2f} руб.\n"
+        message += f"📊 Остаток: {remaining_debt:.2f} руб.\n\n"
+        message += "Просроченные чеки:\n"
+        for debt in data['debts']:
+            message += f"- {debt['amount']:.2f} руб. (просрочка {debt['days_overdue']} дней)\n"
+        message += "\n"
+
+    # The snapshot reports "nothing overdue" instead of a bare header
+    if message == REPORT_HEADER:
+        return []
+    return [message[x:x + 4096] for x in range(0, len(message), 4096)]
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.executescript('''
+        CREATE TABLE clients (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, phone TEXT NOT NULL);
+        CREATE TABLE receipts (id INTEGER PRIMARY KEY AUTOINCREMENT, client_id INTEGER, photo_id TEXT,
+                               amount REAL, debt_days INTEGER, date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+        CREATE TABLE payments (id INTEGER PRIMARY KEY AUTOINCREMENT, client_id INTEGER, amount REAL,
+                               date TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+    ''')
+    clients = [(1, 'Анна', '+79000000001'), (2, 'Борис', '+79000000002'), (3, 'Вера', '+79000000003')]
+    conn.executemany("INSERT INTO clients VALUES (?, ?, ?)", clients)
+    receipts = [
+        (1, 1, 'p1', 700.0, 3, str(BASE)),
+        (2, 1, 'p2', 300.0, 10, str(BASE + timedelta(hours=5))),
+        (3, 2, 'p3', 150.5, 1, str(BASE + timedelta(days=1))),
+        (4, 3, 'p4', 400.0, 2, str(BASE)),
+    ]
+    conn.executemany("INSERT INTO receipts VALUES (?, ?, ?, ?, ?, ?)", receipts)
+    # Вера has paid her whole debt, Анна part of hers
+    conn.executemany("INSERT INTO payments (client_id, amount) VALUES (?, ?)", [(3, 400.0), (1, 200.0)])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def snapshot_at(conn, now):
+    snapshot = OverdueSnapshot()
+    snapshot.load(conn, now)
+    return snapshot.render(now)
+
+
+@pytest.mark.parametrize('now', [
+    BASE,                                                # nothing is due yet
+    BASE + timedelta(days=2, seconds=-1),                # just before Вера and Борис are due
+    BASE + timedelta(days=2, seconds=1),                 # just after
+    BASE + timedelta(days=3, seconds=1),                 # Анна's first receipt overdue
+    BASE + timedelta(days=4, seconds=-1),                # day counters about to roll over
+    BASE + timedelta(days=4),                            # the exact rollover instant
+    BASE + timedelta(days=4, seconds=1),                 # and just after
+    BASE + timedelta(days=11),                           # every receipt overdue
+])
+def test_render_matches_old_query(conn, now):
+    assert snapshot_at(conn, now) == old_overdue_report(conn, now)
+
+
+def test_fully_paid_client_is_left_out(conn):
+    now = BASE + timedelta(days=30)
+    report = "".join(snapshot_at(conn, now))
+    assert 'Вера' not in report
+    assert 'Анна' in report
+
+
+def test_snapshot_follows_time_and_changes(conn):
+    snapshot = OverdueSnapshot()
+    snapshot.load(conn, BASE)
+
+    # One snapshot advanced through time matches a fresh query at every step.
+    # Steps stay a minute off the due times: the old query compared due dates
+    # truncated to whole seconds, so it saw receipts overdue up to a second early.
+    for hours in range(0, 24 * 12, 7):
+        now = BASE + timedelta(hours=hours, minutes=1)
+        assert snapshot.render(now) == old_overdue_report(conn, now)
+
+    now = BASE + timedelta(days=12)
+    conn.execute("DELETE FROM receipts WHERE id = 3")
+    assert snapshot.receipt_removed(3, now)
+    assert snapshot.render(now) == old_overdue_report(conn, now)
+
+    conn.execute("INSERT INTO payments (client_id, amount) VALUES (1, 800.0)")
+    assert snapshot.payment_added(1, 800.0, now)
+    assert snapshot.render(now) == old_overdue_report(conn, now) == []
+
+    date_added = now - timedelta(days=5)
+    conn.execute("INSERT INTO receipts VALUES (5, 2, 'p5', 99.0, 1, ?)", (str(date_added),))
+    assert snapshot.receipt_added(5, 2, 99.0, date_added, 1, now)
+    assert snapshot.render(now) == old_overdue_report(conn, now)
+
+
+def test_new_receipt_does_not_invalidate_report(conn):
+    now = BASE + timedelta(days=5)
+    snapshot = OverdueSnapshot()
+    snapshot.load(conn, now)
+    chunks = snapshot.render(now)
+
+    assert not snapshot.receipt_added(10, 2, 50.0, now, 7, now)
+    assert snapshot.render(now) is chunks
+    assert not snapshot.receipt_removed(10, now)
+
+
+def test_day_counter_rolls_over_at_exact_instant(conn):
+    snapshot = OverdueSnapshot()
+    snapshot.load(conn, BASE + timedelta(days=3, seconds=1))
+    snapshot.render(BASE + timedelta(days=3, seconds=1))
+
+    now = BASE + timedelta(days=4)
+    assert snapshot.render(now) == old_overdue_report(conn, now)
+
+
+def test_clients_with_the_same_name_are_ordered_by_id(conn):
+    now = BASE + timedelta(days=30)
+    conn.execute("UPDATE clients SET name = 'Анна'")
+    conn.execute("DELETE FROM payments")
+    snapshot = OverdueSnapshot()
+    snapshot.load(conn, now)
+    snapshot.render(now)
+    # Insertion order of the sections must not matter
+    snapshot._sections = dict(reversed(snapshot._sections.items()))
+    assert not snapshot.client_added(4, 'Анна', '+79000000004')
+    assert snapshot.receipt_added(5, 4, 10.0, BASE, 1, now)
+
+    report = "".join(snapshot.render(now))
+    phones = [line for line in report.splitlines() if line.startswith("📱")]
+    assert phones == [f"📱 Телефон: +7900000000{i}" for i in range(1, 5)]
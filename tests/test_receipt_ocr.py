@@ -0,0 +1,47 @@
+"""Total detection on text as Tesseract returns it for typical receipts."""
+import pytest
+
+from receipt_ocr import AMOUNT_RE, find_total, parse_amount
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('45', 45.0),
+    ('45,5', 45.5),
+    ('45.50', 45.5),
+    ('1 234,50', 1234.5),
+    ('1 234.05', 1234.05),
+    ('1 000 000,00', 1000000.0),
+    ('12345', 12345.0),
+])
+def test_parse_amount(text, expected):
+    assert parse_amount(AMOUNT_RE.fullmatch(text).groups()) == expected
+
+
+@pytest.mark.parametrize('text, expected', [
+    # thousands separators
+    ('Итого 1 234,50', 1234.5),
+    ('ИТОГО =1 234.50', 1234.5),
+    ('Итого 1 000 000,00 руб 2 шт', 1000000.0),
+    # dates and times are not amounts
+    ('19.10.2026 12:30\nХлеб 45,00', 45.0),
+    ('Итого 150.00 19/10/26 23:59:59', 150.0),
+    # neither are phone numbers and registration numbers
+    ('Тел +7 900 123 45 67\nХлеб 45.00', 45.0),
+    ('Тел. 8 900-123-45-67\nХлеб 45.00', 45.0),
+    ('ИНН 7707083893\nФН 9999078900004792\nИТОГО 150', 150.0),
+    # quantity columns next to prices
+    ('Молоко 2 x 89.90 = 179.80\nВсего 3 шт 225.30', 225.3),
+    ('Хлеб 45.00 120 шт', 45.0),
+    # keyword lines win over larger amounts elsewhere
+    ('Наличные 2000.00\nИТОГО 1 234,50\nСдача 765,50', 1234.5),
+    ('Total 99.99\nCash 100', 99.99),
+    # no total keyword: the largest amount
+    ('Хлеб 45,00\nМолоко 89,90', 89.9),
+    # nothing that looks like money
+    ('', None),
+    ('Спасибо за покупку!', None),
+    ('19.10.2026 12:30\nИНН 7707083893', None),
+    ('Итого 0,00', None),
+])
+def test_find_total(text, expected):
+    assert find_total(text) == expected
@@ -0,0 +1,44 @@
+"""PerChatUpdateProcessor keeps each chat in order without starving the others."""
+import asyncio
+from datetime import datetime
+
+import pytest
+
+telegram = pytest.importorskip('telegram')
+
+from bot import PerChatUpdateProcessor  # noqa: E402
+
+
+def chat_update(update_id, chat_id):
+    chat = telegram.Chat(chat_id, 'private')
+    return telegram.Update(update_id, message=telegram.Message(update_id, datetime.now(), chat, text='x'))
+
+
+def test_one_chat_at_a_time_and_queued_updates_hold_no_slots():
+    async def run():
+        processor = PerChatUpdateProcessor(2)
+        release = asyncio.Event()
+        events = []
+
+        async def handle(name, wait=False):
+            events.append(f"{name} start")
+            if wait:
+                await release.wait()
+            events.append(f"{name} end")
+
+        # Three updates of a slow chat, then one of another chat, with two slots
+        slow = [
+            asyncio.create_task(processor.process_update(chat_update(i, 1), handle(f"slow{i}", wait=True)))
+            for i in range(3)
+        ]
+        await asyncio.sleep(0.01)
+        other = asyncio.create_task(processor.process_update(chat_update(9, 2), handle("other")))
+        await asyncio.wait_for(other, 1)
+        assert events == ["slow0 start", "other start", "other end"]
+
+        release.set()
+        await asyncio.gather(*slow)
+        assert events[3:] == ["slow0 end", "slow1 start", "slow1 end", "slow2 start", "slow2 end"]
+        assert processor._locks == {}
+
+    asyncio.run(run())